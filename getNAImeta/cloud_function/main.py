@@ -5,32 +5,73 @@ Deploy this as a Cloud Function to enable alpha channel extraction from GAS
 
 import json
 import base64
-import gzip
 import re
+import struct
+import zlib
 from io import BytesIO
+from types import MappingProxyType
 import functions_framework
 from PIL import Image
 import numpy as np
 
+try:
+    # orjson: several times faster than the stdlib json module
+    import orjson
+
+    json_loads = orjson.loads
+
+    def json_dumps(obj):
+        return orjson.dumps(obj).decode("utf-8")
+
+except ImportError:
+    json_loads = json.loads
+    json_dumps = json.dumps
+
+try:
+    # libdeflate: much faster one-shot gunzip for the in-memory payload
+    from deflate import gzip_decompress
+except ImportError:
+    from gzip import decompress as gzip_decompress
+
 
 def byteize(alpha):
     """Convert alpha channel to bytes (from NovelAI official code)"""
-    alpha = alpha.T.reshape((-1,))
-    alpha = alpha[: (alpha.shape[0] // 8) * 8]
-    alpha = np.bitwise_and(alpha, 1)
-    alpha = alpha.reshape((-1, 8))
-    alpha = np.packbits(alpha, axis=1)
-    return alpha
+    height, width = alpha.shape
+    if height % 8 == 0:
+        # Every packed byte is 8 rows of one column: OR the row-major LSB
+        # planes together, so only the 8x smaller result gets transposed
+        packed = np.zeros((height // 8, width), dtype=np.uint8)
+        for shift in range(8):
+            packed |= (alpha[7 - shift :: 8] & 1) << shift
+        return packed.T.reshape((-1,))
+
+    # Transpose and mask in one pass into a single C-ordered buffer
+    bits = np.empty(alpha.shape[::-1], dtype=np.uint8)
+    np.bitwise_and(alpha.T, 1, out=bits)
+    bits = bits.reshape((-1,))
+    return np.packbits(bits[: (bits.shape[0] // 8) * 8])
 
 
 class LSBExtractor:
     """LSB (Least Significant Bit) extractor for alpha channel"""
 
     def __init__(self, data):
-        self.data = byteize(data[..., -1])
+        # Bytes are packed lazily, so a magic mismatch only costs a few columns
+        self.alpha = data
+        self.size = data.size // 8
+        self.data = np.empty(0, dtype=np.uint8)
         self.pos = 0
 
+    def _ensure(self, n):
+        """Pack enough leading columns of the alpha plane to cover n bytes"""
+        if n <= len(self.data) or len(self.data) == self.size:
+            return
+        height, width = self.alpha.shape
+        cols = min(width, -(-n * 8 // height))
+        self.data = byteize(self.alpha[:, :cols])
+
     def get_one_byte(self):
+        self._ensure(self.pos + 1)
         if self.pos >= len(self.data):
             return None
         byte = self.data[self.pos]
@@ -38,41 +79,124 @@ class LSBExtractor:
         return byte
 
     def get_next_n_bytes(self, n):
+        self._ensure(self.pos + n)
         if self.pos + n > len(self.data):
-            return bytearray()
-        n_bytes = self.data[self.pos : self.pos + n]
+            return memoryview(b"")
+        # Zero-copy view over the packed bytes
+        n_bytes = memoryview(self.data[self.pos : self.pos + n])
         self.pos += n
-        return bytearray(n_bytes)
+        return n_bytes
 
     def read_32bit_integer(self):
         bytes_list = self.get_next_n_bytes(4)
         if len(bytes_list) == 4:
-            integer_value = int.from_bytes(bytes_list, byteorder="big")
-            return integer_value
+            return int(np.frombuffer(bytes_list, dtype=">u4")[0])
         else:
             return None
 
 
-def extract_from_alpha_channel(image_data):
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+STEALTH_MAGIC = b"stealth_pngcomp"
+
+
+def iter_png_chunks(png_bytes):
+    """Yield (type, data) for each chunk of a PNG byte string"""
+    if not png_bytes.startswith(PNG_SIGNATURE):
+        return
+
+    pos = len(PNG_SIGNATURE)
+    while pos + 8 <= len(png_bytes):
+        length, chunk_type = struct.unpack_from(">I4s", png_bytes, pos)
+        yield chunk_type, png_bytes[pos + 8 : pos + 8 + length]
+        pos += length + 12  # length + type + data + crc
+        if chunk_type == b"IEND":
+            return
+
+
+def stealth_magic_possible(png_bytes):
+    """Cheap pre-check: False only if the stealth magic is definitely absent
+
+    The magic is carried by the LSBs of the first 120 alpha samples of
+    column 0. In 8-bit RGBA/LA scanlines that column unfilters on its own
+    (its left neighbour is always 0), so only the first 120 rows need to be
+    inflated rather than the whole image. Anything unusual returns True and
+    is left to the full PIL path.
+    """
+    magic_bits = len(STEALTH_MAGIC) * 8
+    try:
+        chunks = iter_png_chunks(png_bytes)
+        chunk_type, ihdr = next(chunks, (None, b""))
+        if chunk_type != b"IHDR" or len(ihdr) < 13:
+            return True
+        width, height, depth, color, _, _, interlace = struct.unpack(
+            ">IIBBBBB", ihdr[:13]
+        )
+        channels = {6: 4, 4: 2}.get(color)  # RGBA, LA
+        if depth != 8 or channels is None or interlace or height < magic_bits:
+            return True
+
+        stride = 1 + width * channels
+        needed = stride * magic_bits
+        inflater = zlib.decompressobj()
+        rows = bytearray()
+        for chunk_type, data in chunks:
+            if chunk_type != b"IDAT":
+                if rows:
+                    break  # IDAT chunks are consecutive
+                continue
+            rows += inflater.decompress(data, needed - len(rows))
+            while len(rows) < needed and inflater.unconsumed_tail:
+                rows += inflater.decompress(
+                    inflater.unconsumed_tail, needed - len(rows)
+                )
+            if len(rows) >= needed:
+                break
+        if len(rows) < needed:
+            return True
+    except (zlib.error, struct.error):
+        return True
+
+    # Undo the scanline filter for the column 0 alpha byte only: Sub adds
+    # the (zero) left neighbour and Paeth always predicts the byte above
+    alpha = 0
+    bits = 0
+    for row in range(magic_bits):
+        filter_type = rows[row * stride]
+        raw = rows[row * stride + channels]
+        if filter_type in (2, 4):  # Up, Paeth
+            alpha = (raw + alpha) & 0xFF
+        elif filter_type == 3:  # Average
+            alpha = (raw + alpha // 2) & 0xFF
+        else:  # None, Sub
+            alpha = raw
+        bits = (bits << 1) | (alpha & 1)
+
+    return bits.to_bytes(len(STEALTH_MAGIC), byteorder="big") == STEALTH_MAGIC
+
+
+def extract_from_alpha_channel(image_bytes):
     """Extract metadata from alpha channel using NovelAI's stealth method"""
     try:
-        # Convert base64 to PIL Image
-        image_bytes = base64.b64decode(image_data)
-        image = Image.open(BytesIO(image_bytes)).convert("RGBA")
-        image_array = np.array(image)
-
-        if image_array.shape[-1] != 4 or len(image_array.shape) != 3:
+        # Reject non-stealth PNGs before PIL inflates and unfilters every pixel
+        if not stealth_magic_possible(image_bytes):
             return None
 
-        reader = LSBExtractor(image_array)
-        magic = "stealth_pngcomp"
+        image = Image.open(BytesIO(image_bytes))
 
-        try:
-            read_magic = reader.get_next_n_bytes(len(magic)).decode("utf-8")
-        except:
+        # Without an alpha band there is nowhere to hide the payload
+        if "A" not in image.getbands():
             return None
 
-        if magic != read_magic:
+        # Only the alpha plane is needed: read it as one raw buffer
+        alpha = image.getchannel("A").tobytes("raw", "L", 0, 1)
+        alpha_array = np.frombuffer(alpha, dtype=np.uint8).reshape(
+            image.height, image.width
+        )
+
+        reader = LSBExtractor(alpha_array)
+        magic = STEALTH_MAGIC
+
+        if reader.get_next_n_bytes(len(magic)) != magic:
             return None
 
         read_len = reader.read_32bit_integer()
@@ -83,14 +207,14 @@ def extract_from_alpha_channel(image_data):
         json_data = reader.get_next_n_bytes(read_len)
 
         try:
-            json_data = json.loads(gzip.decompress(json_data).decode("utf-8"))
+            json_data = json_loads(gzip_decompress(json_data))
         except:
             return None
 
         # Handle nested Comment JSON
         if "Comment" in json_data and isinstance(json_data["Comment"], str):
             try:
-                json_data["Comment"] = json.loads(json_data["Comment"])
+                json_data["Comment"] = json_loads(json_data["Comment"])
             except:
                 pass
 
@@ -101,39 +225,64 @@ def extract_from_alpha_channel(image_data):
         return None
 
 
+def first(*values):
+    """Return first non-empty value"""
+    for v in values:
+        if isinstance(v, str):
+            v = v.strip()
+        if v not in ("", None, []):
+            return v
+    return ""
+
+
+def first2(a, b):
+    """Two-value first() without building a varargs tuple"""
+    if isinstance(a, str):
+        a = a.strip()
+    if a not in ("", None, []):
+        return a
+    if isinstance(b, str):
+        b = b.strip()
+    return "" if b in ("", None, []) else b
+
+
+# Shared read-only default for .get() chains (no fresh {} per lookup)
+EMPTY = MappingProxyType({})
+
+
+def captions(data):
+    """Return the v4 positive/negative caption blocks of a metadata dict"""
+    return (
+        data.get("v4_prompt", EMPTY).get("caption", EMPTY),
+        data.get("v4_negative_prompt", EMPTY).get("caption", EMPTY),
+    )
+
+
 def extract_prompt_data(json_data):
     """Extract prompt information from JSON data"""
     if not json_data:
         return {}
 
-    def first(*values):
-        """Return first non-empty value"""
-        for v in values:
-            if isinstance(v, str):
-                v = v.strip()
-            if v not in ("", None, []):
-                return v
-        return ""
+    # Look up the nested blocks once instead of re-walking them per field
+    comment = json_data.get("Comment")
+    if not isinstance(comment, dict):
+        comment = EMPTY
+    pos_caption, neg_caption = captions(json_data)
+    comment_pos_caption, comment_neg_caption = captions(comment)
 
     # Extract basic prompts
     base_prompt = first(
-        json_data.get("v4_prompt", {}).get("caption", {}).get("base_caption"),
+        pos_caption.get("base_caption"),
         json_data.get("prompt"),
-        json_data.get("Comment", {})
-        .get("v4_prompt", {})
-        .get("caption", {})
-        .get("base_caption"),
-        json_data.get("Comment", {}).get("prompt"),
+        comment_pos_caption.get("base_caption"),
+        comment.get("prompt"),
     )
 
     uc_prompt = first(
         json_data.get("uc"),
-        json_data.get("v4_negative_prompt", {}).get("caption", {}).get("base_caption"),
-        json_data.get("Comment", {}).get("uc"),
-        json_data.get("Comment", {})
-        .get("v4_negative_prompt", {})
-        .get("caption", {})
-        .get("base_caption"),
+        neg_caption.get("base_caption"),
+        comment.get("uc"),
+        comment_neg_caption.get("base_caption"),
     )
 
     # Extract model info
@@ -142,37 +291,24 @@ def extract_prompt_data(json_data):
         json_data.get("sampler"),
         json_data.get("Software"),
         json_data.get("Source"),
-        json_data.get("Comment", {}).get("model"),
-        json_data.get("Comment", {}).get("sampler"),
+        comment.get("model"),
+        comment.get("sampler"),
         f"v{json_data.get('version')}" if json_data.get("version") else "",
-        f"v{json_data.get('Comment', {}).get('version')}"
-        if json_data.get("Comment", {}).get("version")
-        else "",
+        f"v{comment.get('version')}" if comment.get("version") else "",
     )
 
     # Extract dimensions
-    width = first(
-        json_data.get("width"),
-        json_data.get("Comment", {}).get("width"),
-    )
-
-    height = first(
-        json_data.get("height"),
-        json_data.get("Comment", {}).get("height"),
-    )
+    width = first2(json_data.get("width"), comment.get("width"))
+    height = first2(json_data.get("height"), comment.get("height"))
 
     # Extract character prompts
     char_captions = []
-    pos_chars = json_data.get("v4_prompt", {}).get("caption", {}).get(
-        "char_captions", []
-    ) or json_data.get("Comment", {}).get("v4_prompt", {}).get("caption", {}).get(
-        "char_captions", []
+    pos_chars = pos_caption.get("char_captions") or comment_pos_caption.get(
+        "char_captions", ()
+    )
+    neg_chars = neg_caption.get("char_captions") or comment_neg_caption.get(
+        "char_captions", ()
     )
-    neg_chars = json_data.get("v4_negative_prompt", {}).get("caption", {}).get(
-        "char_captions", []
-    ) or json_data.get("Comment", {}).get("v4_negative_prompt", {}).get(
-        "caption", {}
-    ).get("char_captions", [])
 
     for i in range(6):
         char_prompt = pos_chars[i]["char_caption"] if i < len(pos_chars) else ""
@@ -191,43 +327,95 @@ def extract_prompt_data(json_data):
     }
 
 
-def extract_from_png_text_chunks(image_data):
-    """Extract metadata from PNG tEXt chunks (standard metadata)"""
-    try:
-        image_bytes = base64.b64decode(image_data)
-        image = Image.open(BytesIO(image_bytes))
+MAX_TEXT_CHUNK = 1024 * 1024  # same cap PIL uses for compressed text
 
-        # Get PNG info
-        if hasattr(image, "info"):
-            metadata = {}
-
-            # Common NovelAI metadata fields in tEXt chunks
-            for key in ["Title", "Description", "Comment", "Software", "Source"]:
-                if key in image.info:
-                    value = image.info[key]
-                    # Try to parse as JSON if it looks like JSON
-                    if isinstance(value, str) and value.strip().startswith("{"):
-                        try:
-                            metadata[key] = json.loads(value)
-                        except:
-                            metadata[key] = value
-                    else:
-                        metadata[key] = value
 
-            # Also check for any other text chunks
-            for key, value in image.info.items():
-                if key not in metadata:
+def _inflate_text(data):
+    """Decompress a zTXt/iTXt body, refusing oversized (bomb) payloads"""
+    inflater = zlib.decompressobj()
+    text = inflater.decompress(data, MAX_TEXT_CHUNK)
+    if inflater.unconsumed_tail:
+        raise ValueError("Compressed text chunk too large")
+    return text
+
+
+def read_png_text_chunks(png_bytes):
+    """Walk PNG chunks up to the first IDAT and collect tEXt/zTXt/iTXt
+
+    Text metadata precedes the pixel data, so this never inflates IDAT.
+    """
+    text_chunks = {}
+    for chunk_type, data in iter_png_chunks(png_bytes):
+        if chunk_type in (b"IDAT", b"IEND"):
+            break
+
+        try:
+            if chunk_type == b"tEXt":
+                key, _, value = data.partition(b"\0")
+                text_chunks[key.decode("latin-1")] = value.decode("latin-1")
+            elif chunk_type == b"zTXt":
+                # First byte after the keyword is the compression method
+                key, _, value = data.partition(b"\0")
+                text = _inflate_text(value[1:])
+                text_chunks[key.decode("latin-1")] = text.decode("latin-1")
+            elif chunk_type == b"iTXt":
+                key, _, value = data.partition(b"\0")
+                compressed = value[:1] == b"\1"
+                _lang, _, value = value[2:].partition(b"\0")
+                _translated_key, _, value = value.partition(b"\0")
+                if compressed:
+                    value = _inflate_text(value)
+                text_chunks[key.decode("latin-1")] = value.decode("utf-8")
+        except (zlib.error, ValueError):
+            continue
+
+    return text_chunks
+
+
+def extract_from_png_text_chunks(image_bytes):
+    """Extract metadata from PNG tEXt/zTXt/iTXt chunks (standard metadata)"""
+    try:
+        text_chunks = read_png_text_chunks(image_bytes)
+        metadata = {}
+
+        # Common NovelAI metadata fields in tEXt chunks
+        for key in ["Title", "Description", "Comment", "Software", "Source"]:
+            if key in text_chunks:
+                value = text_chunks[key]
+                # Try to parse as JSON if it looks like JSON
+                if value.strip().startswith("{"):
+                    try:
+                        metadata[key] = json_loads(value)
+                    except:
+                        metadata[key] = value
+                else:
                     metadata[key] = value
 
-            return metadata if metadata else None
+        # Also check for any other text chunks
+        for key, value in text_chunks.items():
+            if key not in metadata:
+                metadata[key] = value
 
-        return None
+        return metadata if metadata else None
 
     except Exception as e:
         print(f"PNG text chunk extraction failed: {e}")
         return None
 
 
+def warm_up():
+    """Run lazy initialisers at cold start instead of on the first request"""
+    # Registers the PNG plugin and loads its encoder/decoder
+    buffer = BytesIO()
+    Image.new("RGBA", (8, 8)).save(buffer, "PNG")
+    alpha = Image.open(buffer).getchannel("A").tobytes()
+    # First-call setup of the NumPy routines used by byteize
+    byteize(np.frombuffer(alpha, dtype=np.uint8).reshape(8, 8))
+
+
+warm_up()
+
+
 @functions_framework.http
 def extract_novelai_metadata(request):
     """
@@ -264,7 +452,7 @@ def extract_novelai_metadata(request):
         request_json = request.get_json(silent=True)
         if not request_json:
             return (
-                json.dumps({"success": False, "error": "Invalid JSON in request"}),
+                json_dumps({"success": False, "error": "Invalid JSON in request"}),
                 400,
                 headers,
             )
@@ -274,20 +462,33 @@ def extract_novelai_metadata(request):
 
         if not image_data:
             return (
-                json.dumps({"success": False, "error": "No image_data provided"}),
+                json_dumps({"success": False, "error": "No image_data provided"}),
+                400,
+                headers,
+            )
+
+        # Decode the payload once and share it between both extractors
+        try:
+            image_bytes = base64.b64decode(image_data)
+        except Exception as e:
+            return (
+                json_dumps({"success": False, "error": f"Invalid image_data: {e}"}),
                 400,
                 headers,
             )
 
-        # Extract metadata from alpha channel
-        raw_metadata = extract_from_alpha_channel(image_data)
+        # PNG text chunks sit before the pixel data, so read them first
+        text_metadata = extract_from_png_text_chunks(image_bytes)
 
-        # Also try to extract from PNG text chunks
-        text_metadata = extract_from_png_text_chunks(image_data)
+        # Only decode the alpha channel when the text chunks carry no
+        # NovelAI Comment JSON; otherwise the pixels are never inflated
+        raw_metadata = None
+        if not (text_metadata and isinstance(text_metadata.get("Comment"), dict)):
+            raw_metadata = extract_from_alpha_channel(image_bytes)
 
         if not raw_metadata and not text_metadata:
             return (
-                json.dumps(
+                json_dumps(
                     {
                         "success": False,
                         "error": "No metadata found in alpha channel or PNG text chunks",
@@ -315,7 +516,7 @@ def extract_novelai_metadata(request):
         processed_metadata = extract_prompt_data(combined_metadata)
 
         return (
-            json.dumps(
+            json_dumps(
                 {"success": True, "metadata": processed_metadata, "filename": filename}
             ),
             200,
@@ -324,7 +525,7 @@ def extract_novelai_metadata(request):
 
     except Exception as e:
         return (
-            json.dumps({"success": False, "error": f"Processing error: {str(e)}"}),
+            json_dumps({"success": False, "error": f"Processing error: {str(e)}"}),
             500,
             headers,
         )
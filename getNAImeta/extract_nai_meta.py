@@ -1,20 +1,51 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import json, csv, sys, pathlib, shutil, re
-from subprocess import run, PIPE
-import gzip
+import json, csv, os, sys, pathlib, shutil, re, struct, zlib
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from io import BytesIO
+from itertools import islice
+from operator import itemgetter
+from subprocess import Popen, PIPE
+from types import MappingProxyType
 from typing import Union
 
+try:
+    # orjson: several times faster than the stdlib json module
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
+
+try:
+    # libdeflate: much faster one-shot gunzip for the in-memory payload
+    from deflate import gzip_decompress
+except ImportError:
+    from gzip import decompress as gzip_decompress
+
 try:
     from PIL import Image
-    import numpy as np
 
     PIL_AVAILABLE = True
 except ImportError:
     PIL_AVAILABLE = False
-    print("⚠️  PIL/numpy not available. Alpha channel extraction will be skipped.")
-    print("   Install with: pip install Pillow numpy")
+    print("⚠️  PIL not available. Alpha channel extraction will be skipped.")
+    print("   Install with: pip install Pillow  (numpy / numba: optional speedups)")
+
+try:
+    import numpy as np
+
+    NUMPY_AVAILABLE = True
+except ImportError:
+    # Alpha extraction falls back to the pure-Python LSB reader
+    NUMPY_AVAILABLE = False
+
+try:
+    from numba import njit
+
+    NUMBA_AVAILABLE = PIL_AVAILABLE and NUMPY_AVAILABLE
+except ImportError:
+    NUMBA_AVAILABLE = False
 
 # UUID pattern for NovelAI images
 uuid_pat = re.compile(
@@ -24,111 +55,369 @@ uuid_pat = re.compile(
 )
 
 
+def is_uuid_png(fn: str) -> bool:
+    """uuid_pat の前段の安価な形チェック（長さとハイフン位置だけ見る）"""
+    return (
+        len(fn) == 40
+        and fn[8] == fn[13] == fn[18] == fn[23] == "-"
+        and fn[-4:].lower() == ".png"
+    )
+
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+STEALTH_MAGIC = b"stealth_pngcomp"
+
+# ExifTool に一度に渡すファイル数（-stay_open の 1 -execute 分）
+EXIFTOOL_BATCH = 200
+
+# CSV の列順（行 dict からこの順で値を取り出して書き出す）
+CSV_FIELDS = [
+    "filename",
+    "image_w",
+    "image_h",
+    "model",
+    "base_prompt",
+    "UC",
+    "extraction_method",
+] + sum([[f"char{i}_prompt", f"char{i}_UC"] for i in range(1, 7)], [])
+
+
 def byteize(alpha):
     """Convert alpha channel to bytes (from NovelAI official code)"""
-    alpha = alpha.T.reshape((-1,))
-    alpha = alpha[: (alpha.shape[0] // 8) * 8]
-    alpha = np.bitwise_and(alpha, 1)
-    alpha = alpha.reshape((-1, 8))
-    alpha = np.packbits(alpha, axis=1)
-    return alpha
+    height, width = alpha.shape
+    if height % 8 == 0:
+        # Every packed byte is 8 rows of one column: OR the row-major LSB
+        # planes together, so only the 8x smaller result gets transposed
+        packed = np.zeros((height // 8, width), dtype=np.uint8)
+        for shift in range(8):
+            packed |= (alpha[7 - shift :: 8] & 1) << shift
+        return packed.T.reshape((-1,))
+
+    # Transpose and mask in one pass into a single C-ordered buffer
+    bits = np.empty(alpha.shape[::-1], dtype=np.uint8)
+    np.bitwise_and(alpha.T, 1, out=bits)
+    bits = bits.reshape((-1,))
+    return np.packbits(bits[: (bits.shape[0] // 8) * 8])
 
 
 class LSBExtractor:
     """LSB (Least Significant Bit) extractor for alpha channel (from NovelAI official code)"""
 
     def __init__(self, data):
-        self.data = byteize(data[..., -1])
+        # Bytes are packed lazily, so a magic mismatch only costs a few columns
+        self.alpha = data
+        self.size = data.size // 8
+        self.data = np.empty(0, dtype=np.uint8)
         self.pos = 0
 
+    def _ensure(self, n):
+        """Pack enough leading columns of the alpha plane to cover n bytes"""
+        if n <= len(self.data) or len(self.data) == self.size:
+            return
+        height, width = self.alpha.shape
+        cols = min(width, -(-n * 8 // height))
+        self.data = byteize(self.alpha[:, :cols])
+
     def get_one_byte(self):
+        self._ensure(self.pos + 1)
         byte = self.data[self.pos]
         self.pos += 1
         return byte
 
     def get_next_n_bytes(self, n):
-        n_bytes = self.data[self.pos : self.pos + n]
+        self._ensure(self.pos + n)
+        # Zero-copy view over the packed bytes
+        n_bytes = memoryview(self.data[self.pos : self.pos + n])
         self.pos += n
-        return bytearray(n_bytes)
+        return n_bytes
 
     def read_32bit_integer(self):
         bytes_list = self.get_next_n_bytes(4)
         if len(bytes_list) == 4:
-            integer_value = int.from_bytes(bytes_list, byteorder="big")
-            return integer_value
+            return int(np.frombuffer(bytes_list, dtype=">u4")[0])
         else:
             return None
 
 
-def extract_from_alpha_channel(image_path: pathlib.Path) -> dict | None:
+if NUMBA_AVAILABLE:
+    STEALTH_MAGIC_ARRAY = np.frombuffer(STEALTH_MAGIC, dtype=np.uint8).copy()
+
+    @njit(cache=True)
+    def extract_payload(alpha):
+        """Stream-pack alpha LSBs and return the gzip payload (empty if none)
+
+        Walks the plane column by column (the same order as ``alpha.T``) and
+        stops as soon as the length-prefixed payload has been read, instead
+        of packing every pixel up front like ``byteize``.
+        """
+        height, width = alpha.shape
+        magic_len = STEALTH_MAGIC_ARRAY.shape[0]
+        header_len = magic_len + 4
+        available = (height * width) // 8
+
+        out = np.empty(header_len, dtype=np.uint8)
+        needed = header_len
+        n = 0
+        acc = 0
+        nbits = 0
+        for x in range(width):
+            for y in range(height):
+                acc = (acc << 1) | (alpha[y, x] & 1)
+                nbits += 1
+                if nbits < 8:
+                    continue
+
+                out[n] = acc
+                n += 1
+                acc = 0
+                nbits = 0
+
+                if n == magic_len:
+                    for i in range(magic_len):
+                        if out[i] != STEALTH_MAGIC_ARRAY[i]:
+                            return np.empty(0, dtype=np.uint8)
+                elif n == header_len:
+                    length = 0
+                    for i in range(magic_len, header_len):
+                        length = (length << 8) | out[i]
+                    needed = header_len + length // 8
+                    if needed > available:
+                        return np.empty(0, dtype=np.uint8)
+                    header = out
+                    out = np.empty(needed, dtype=np.uint8)
+                    out[:header_len] = header
+
+                if n == needed:
+                    return out[header_len:]
+
+        return np.empty(0, dtype=np.uint8)
+
+
+def extract_payload_py(alpha: bytes, width: int, height: int) -> bytes:
+    """Pure-Python stealth payload reader for installs without NumPy
+
+    Packs column-major alpha LSBs with a shift accumulator and stops once
+    the length-prefixed payload is complete. Returns b"" if there is none.
+    """
+
+    def packed_bytes():
+        acc = nbits = 0
+        for x in range(width):
+            for i in range(x, width * height, width):
+                acc = (acc << 1) | (alpha[i] & 1)
+                nbits += 1
+                if nbits == 8:
+                    yield acc
+                    acc = nbits = 0
+
+    stream = packed_bytes()
+    magic = STEALTH_MAGIC
+    header = bytes(islice(stream, len(magic) + 4))
+    if len(header) < len(magic) + 4 or header[: len(magic)] != magic:
+        return b""
+
+    read_len = int.from_bytes(header[len(magic) :], byteorder="big") // 8
+    payload = bytes(islice(stream, read_len))
+    return payload if len(payload) == read_len else b""
+
+
+def read_lsb_payload(alpha_array) -> memoryview | bytes:
+    """Read the stealth payload with LSBExtractor (b"" if there is none)"""
+    reader = LSBExtractor(alpha_array)
+    magic = STEALTH_MAGIC
+
+    if reader.get_next_n_bytes(len(magic)) != magic:
+        return b""
+
+    read_len = reader.read_32bit_integer()
+    if read_len is None:
+        return b""
+
+    return reader.get_next_n_bytes(read_len // 8)
+
+
+def iter_png_chunks(png_bytes):
+    """Yield (type, data) for each chunk of a PNG byte string"""
+    if not png_bytes.startswith(PNG_SIGNATURE):
+        return
+
+    pos = len(PNG_SIGNATURE)
+    while pos + 8 <= len(png_bytes):
+        length, chunk_type = struct.unpack_from(">I4s", png_bytes, pos)
+        yield chunk_type, png_bytes[pos + 8 : pos + 8 + length]
+        pos += length + 12  # length + type + data + crc
+        if chunk_type == b"IEND":
+            return
+
+
+def stealth_magic_possible(png_bytes):
+    """Cheap pre-check: False only if the stealth magic is definitely absent
+
+    The magic is carried by the LSBs of the first 120 alpha samples of
+    column 0. In 8-bit RGBA/LA scanlines that column unfilters on its own
+    (its left neighbour is always 0), so only the first 120 rows need to be
+    inflated rather than the whole image. Anything unusual returns True and
+    is left to the full PIL path.
+    """
+    magic_bits = len(STEALTH_MAGIC) * 8
+    try:
+        chunks = iter_png_chunks(png_bytes)
+        chunk_type, ihdr = next(chunks, (None, b""))
+        if chunk_type != b"IHDR" or len(ihdr) < 13:
+            return True
+        width, height, depth, color, _, _, interlace = struct.unpack(
+            ">IIBBBBB", ihdr[:13]
+        )
+        channels = {6: 4, 4: 2}.get(color)  # RGBA, LA
+        if depth != 8 or channels is None or interlace or height < magic_bits:
+            return True
+
+        stride = 1 + width * channels
+        needed = stride * magic_bits
+        inflater = zlib.decompressobj()
+        rows = bytearray()
+        for chunk_type, data in chunks:
+            if chunk_type != b"IDAT":
+                if rows:
+                    break  # IDAT chunks are consecutive
+                continue
+            rows += inflater.decompress(data, needed - len(rows))
+            while len(rows) < needed and inflater.unconsumed_tail:
+                rows += inflater.decompress(
+                    inflater.unconsumed_tail, needed - len(rows)
+                )
+            if len(rows) >= needed:
+                break
+        if len(rows) < needed:
+            return True
+    except (zlib.error, struct.error):
+        return True
+
+    # Undo the scanline filter for the column 0 alpha byte only: Sub adds
+    # the (zero) left neighbour and Paeth always predicts the byte above
+    alpha = 0
+    bits = 0
+    for row in range(magic_bits):
+        filter_type = rows[row * stride]
+        raw = rows[row * stride + channels]
+        if filter_type in (2, 4):  # Up, Paeth
+            alpha = (raw + alpha) & 0xFF
+        elif filter_type == 3:  # Average
+            alpha = (raw + alpha // 2) & 0xFF
+        else:  # None, Sub
+            alpha = raw
+        bits = (bits << 1) | (alpha & 1)
+
+    return bits.to_bytes(len(STEALTH_MAGIC), byteorder="big") == STEALTH_MAGIC
+
+
+def extract_from_alpha_channel(image_path: str) -> dict | None:
     """Extract metadata from alpha channel using NovelAI's stealth method"""
     if not PIL_AVAILABLE:
         return None
 
     try:
-        image = Image.open(image_path).convert("RGBA")
-        image_array = np.array(image)
-
-        if image_array.shape[-1] != 4 or len(image_array.shape) != 3:
+        # Reject non-stealth PNGs before PIL inflates and unfilters every pixel
+        with open(image_path, "rb") as f:
+            png_bytes = f.read()
+        if not stealth_magic_possible(png_bytes):
             return None
 
-        reader = LSBExtractor(image_array)
-        magic = "stealth_pngcomp"
-
-        try:
-            read_magic = reader.get_next_n_bytes(len(magic)).decode("utf-8")
-        except:
+        image = Image.open(BytesIO(png_bytes))
+        # Without an alpha band there is nowhere to hide the payload
+        if "A" not in image.getbands():
             return None
 
-        if magic != read_magic:
-            return None
+        # Only the alpha plane is needed: read it as one raw buffer
+        alpha = image.getchannel("A").tobytes("raw", "L", 0, 1)
 
-        read_len = reader.read_32bit_integer()
-        if read_len is None:
-            return None
+        if not NUMPY_AVAILABLE:
+            json_data = extract_payload_py(alpha, image.width, image.height)
+        else:
+            alpha_array = np.frombuffer(alpha, dtype=np.uint8).reshape(
+                image.height, image.width
+            )
+            if NUMBA_AVAILABLE:
+                json_data = extract_payload(alpha_array).tobytes()
+            else:
+                json_data = read_lsb_payload(alpha_array)
 
-        read_len = read_len // 8
-        json_data = reader.get_next_n_bytes(read_len)
+        if not json_data:
+            return None
 
         try:
-            json_data = json.loads(gzip.decompress(json_data).decode("utf-8"))
+            json_data = json_loads(gzip_decompress(json_data))
         except:
             return None
 
         # Handle nested Comment JSON
         if "Comment" in json_data and isinstance(json_data["Comment"], str):
             try:
-                json_data["Comment"] = json.loads(json_data["Comment"])
+                json_data["Comment"] = json_loads(json_data["Comment"])
             except:
                 pass
 
         return json_data
 
     except Exception as e:
-        print(f"⚠️  Alpha channel extraction failed for {image_path.name}: {e}")
+        name = os.path.basename(image_path)
+        print(f"⚠️  Alpha channel extraction failed for {name}: {e}")
         return None
 
 
-# デフォルトでimagesフォルダを対象に
-folder = pathlib.Path(sys.argv[1] if len(sys.argv) > 1 else "./images").expanduser()
-pngs = sorted(folder.glob("*.png"))
-if not pngs:
-    sys.exit("❌ No .png files")
-
-exiftool = shutil.which("exiftool")
-if not exiftool:
-    sys.exit("❌ exiftool not found")
+def exiftool_batches(exiftool: str, pngs: list[pathlib.Path]):
+    """ExifTool を -stay_open で常駐させ、バッチごとの JSON を順に返す"""
+    proc = Popen(
+        [exiftool, "-stay_open", "True", "-@", "-"],
+        stdin=PIPE,
+        stdout=PIPE,
+        encoding="utf-8",
+    )
+    batches = [
+        pngs[i : i + EXIFTOOL_BATCH] for i in range(0, len(pngs), EXIFTOOL_BATCH)
+    ]
 
-cmd = [exiftool, "-j", "-u", "-n"] + [str(p) for p in pngs]
-proc = run(cmd, stdout=PIPE, stderr=PIPE, text=True)
-if proc.returncode:
-    print(proc.stderr)
-    sys.exit("❌ ExifTool error")
+    def send(batch):
+        args = ["-j", "-u", "-n"] + [str(p) for p in batch] + ["-execute"]
+        proc.stdin.write("\n".join(args) + "\n")
+        proc.stdin.flush()
 
-outer_all = json.loads(proc.stdout)
-rows, misses = [], []
-alpha_attempts = 0
-alpha_successes = 0
+    try:
+        send(batches[0])
+        for i in range(len(batches)):
+            lines = []
+            for line in proc.stdout:
+                if line.rstrip() == "{ready}":
+                    break
+                lines.append(line)
+            else:
+                sys.exit("❌ ExifTool error")
+
+            # 次のバッチは {ready} を読み切ってから渡す（ExifTool が stdin を
+            # 読んでいない間に書くと、パイプが詰まって双方が待ち続ける）。
+            # 渡した後に yield するので、ExifTool と Python 側の処理は重なる
+            if i + 1 < len(batches):
+                send(batches[i + 1])
+
+            text = "".join(lines).strip()
+            records = json_loads(text) if text else []
+
+            # -@ の引数ファイルでは前後の空白が削られ、# で始まる行は
+            # コメント扱いになる。そうしたパスは結果から黙って消えるので警告する
+            if len(records) != len(batches[i]):
+                got = {os.path.basename(o.get("SourceFile", "")) for o in records}
+                lost = [p.name for p in batches[i] if p.name not in got]
+                more = " …" if len(lost) > 5 else ""
+                print(
+                    f"⚠️  ExifTool returned {len(records)}/{len(batches[i])} files;"
+                    f" missing: {', '.join(lost[:5])}{more}"
+                )
+            yield records
+    finally:
+        if proc.poll() is None:
+            proc.stdin.write("-stay_open\nFalse\n")
+            proc.stdin.close()
+            proc.wait()
 
 
 def first(*values):
@@ -141,33 +430,62 @@ def first(*values):
     return ""
 
 
-for o in outer_all:
-    fn = pathlib.Path(o["SourceFile"]).name
+def first1(v):
+    """first() の 1 値版：strip した値、空なら "" を返す"""
+    if isinstance(v, str):
+        v = v.strip()
+    return "" if v in ("", None, []) else v
+
+
+def first2(a, b):
+    """first() の 2 値版（可変長引数のタプルを作らない）"""
+    a = first1(a)
+    return first1(b) if a == "" else a
+
+
+# .get() チェーン用の共有デフォルト（呼ぶたびに {} を作らない、読み取り専用）
+EMPTY = MappingProxyType({})
+
+
+def captions(inner: dict) -> tuple[dict, dict]:
+    """v4 のポジ／ネガ caption ブロックを一度だけ辿って返す"""
+    return (
+        inner.get("v4_prompt", EMPTY).get("caption", EMPTY),
+        inner.get("v4_negative_prompt", EMPTY).get("caption", EMPTY),
+    )
+
+
+def process_one(o: dict, folder: str) -> tuple[dict, bool, bool]:
+    """1 画像分の CSV 行を作る（行, JSON パース失敗, アルファ抽出を試行）"""
+    # 行ごとに Path を作らず文字列のまま扱う
+    fn = os.path.basename(o["SourceFile"])
     extraction_method = "exiftool"
+    missed = False
+    alpha_attempted = False
 
     # --- 内側 JSON を取得（3 段フォールバック）
     inner_txt = first(o.get("Comment"), o.get("Description"), o.get("Parameters"))
     try:
-        inner = json.loads(inner_txt) if inner_txt else {}
+        inner = json_loads(inner_txt) if inner_txt else {}
     except json.JSONDecodeError:
         inner = {}
-        misses.append(fn)  # ログ用
+        missed = True  # ログ用
 
     # 基本列
-    base_prompt = first(
-        inner.get("v4_prompt", {}).get("caption", {}).get("base_caption"),
-        inner.get("prompt"),
-    )
-    uc_prompt = first(
-        inner.get("uc"),
-        inner.get("v4_negative_prompt", {}).get("caption", {}).get("base_caption"),
-    )
+    pos_caption, neg_caption = captions(inner)
+    base_prompt = first2(pos_caption.get("base_caption"), inner.get("prompt"))
+    uc_prompt = first2(inner.get("uc"), neg_caption.get("base_caption"))
 
     # ExifTool で base_prompt が取れなかったらアルファチャンネル抽出を試行
-    if (not base_prompt and not uc_prompt) and uuid_pat.match(fn) and PIL_AVAILABLE:
+    if (
+        (not base_prompt and not uc_prompt)
+        and is_uuid_png(fn)
+        and uuid_pat.match(fn)
+        and PIL_AVAILABLE
+    ):
         print(f"⏳ Trying alpha channel extraction for {fn}...")
-        alpha_attempts += 1
-        alpha_data = extract_from_alpha_channel(folder / fn)
+        alpha_attempted = True
+        alpha_data = extract_from_alpha_channel(os.path.join(folder, fn))
         if alpha_data:
             # Comment フィールドを優先的に使用
             if "Comment" in alpha_data:
@@ -175,26 +493,18 @@ for o in outer_all:
             else:
                 inner = alpha_data
 
-            base_prompt = first(
-                inner.get("v4_prompt", {}).get("caption", {}).get("base_caption"),
-                inner.get("prompt"),
-            )
-            uc_prompt = first(
-                inner.get("uc"),
-                inner.get("v4_negative_prompt", {})
-                .get("caption", {})
-                .get("base_caption"),
-            )
+            pos_caption, neg_caption = captions(inner)
+            base_prompt = first2(pos_caption.get("base_caption"), inner.get("prompt"))
+            uc_prompt = first2(inner.get("uc"), neg_caption.get("base_caption"))
             extraction_method = "alpha_channel"
-            alpha_successes += 1
             print(f"✅ Alpha channel extraction successful for {fn}")
         else:
             print(f"❌ Alpha channel extraction failed for {fn}")
 
     row = {
         "filename": fn,
-        "image_w": first(inner.get("width"), o.get("ImageWidth")),
-        "image_h": first(inner.get("height"), o.get("ImageHeight")),
+        "image_w": first2(inner.get("width"), o.get("ImageWidth")),
+        "image_h": first2(inner.get("height"), o.get("ImageHeight")),
         "model": first(
             o.get("Source"),
             o.get("Software"),
@@ -208,38 +518,59 @@ for o in outer_all:
     }
 
     # キャラ配列（あれば）
-    pos = inner.get("v4_prompt", {}).get("caption", {}).get("char_captions", [])
-    neg = (
-        inner.get("v4_negative_prompt", {}).get("caption", {}).get("char_captions", [])
-    )
+    pos = pos_caption.get("char_captions", ())
+    neg = neg_caption.get("char_captions", ())
 
     for i in range(6):
-        char_prompt = first(pos[i]["char_caption"] if i < len(pos) else "")
-        char_uc = first(neg[i]["char_caption"] if i < len(neg) else "")
+        char_prompt = first1(pos[i]["char_caption"] if i < len(pos) else "")
+        char_uc = first1(neg[i]["char_caption"] if i < len(neg) else "")
 
         row[f"char{i + 1}_prompt"] = char_prompt
         row[f"char{i + 1}_UC"] = char_uc
 
-    rows.append(row)
-
-# --- CSV 出力
-out = folder.parent / "nai_meta.csv"  # ルートディレクトリに保存
-fields = [
-    "filename",
-    "image_w",
-    "image_h",
-    "model",
-    "base_prompt",
-    "UC",
-    "extraction_method",
-] + sum([[f"char{i}_prompt", f"char{i}_UC"] for i in range(1, 7)], [])
-with out.open("w", newline="", encoding="utf-8") as f:
-    w = csv.DictWriter(f, fieldnames=fields)
-    w.writeheader()
-    w.writerows(rows)
-
-print(f"🎉  {len(rows)} images → {out}")
-if alpha_attempts > 0:
-    print(f"🔍  アルファチャンネル抽出: {alpha_successes}/{alpha_attempts} 件成功")
-if misses:
-    print("⚠️  JSON parse failed on:", ", ".join(misses[:5]), "…")
+    return row, missed, alpha_attempted
+
+
+def main():
+    # デフォルトでimagesフォルダを対象に
+    folder = pathlib.Path(sys.argv[1] if len(sys.argv) > 1 else "./images").expanduser()
+    pngs = sorted(folder.glob("*.png"))
+    if not pngs:
+        sys.exit("❌ No .png files")
+
+    exiftool = shutil.which("exiftool")
+    if not exiftool:
+        sys.exit("❌ exiftool not found")
+
+    # 画像ごとの処理（アルファ抽出が重い）はプロセス並列で、
+    # ExifTool の結果はバッチ単位で届き次第プールに投入する
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+        worker = partial(process_one, folder=str(folder))
+        pending = [
+            ex.map(worker, outer, chunksize=8)
+            for outer in exiftool_batches(exiftool, pngs)
+        ]
+        results = [result for batch in pending for result in batch]
+
+    rows = [row for row, _, _ in results]
+    misses = [row["filename"] for row, missed, _ in results if missed]
+    alpha_attempts = sum(attempted for _, _, attempted in results)
+    alpha_successes = sum(row["extraction_method"] == "alpha_channel" for row in rows)
+
+    # --- CSV 出力
+    out = folder.parent / "nai_meta.csv"  # ルートディレクトリに保存
+    with out.open("w", newline="", encoding="utf-8") as f:
+        # DictWriter の列ごとの dict 引きを避け、位置リストで書き出す
+        w = csv.writer(f)
+        w.writerow(CSV_FIELDS)
+        w.writerows(map(itemgetter(*CSV_FIELDS), rows))
+
+    print(f"🎉  {len(rows)} images → {out}")
+    if alpha_attempts > 0:
+        print(f"🔍  アルファチャンネル抽出: {alpha_successes}/{alpha_attempts} 件成功")
+    if misses:
+        print("⚠️  JSON parse failed on:", ", ".join(misses[:5]), "…")
+
+
+if __name__ == "__main__":
+    main()